@@ -14,6 +14,8 @@ err() { echo -e "${RED}✗${NC} $1"; }
 
 # Detect package manager
 detect_pkg() {
+    # Every later step needs root; fail before doing any work without sudo
+    command -v sudo &>/dev/null || { err "sudo is required"; exit 1; }
     if command -v apt &>/dev/null; then PKG=apt
     elif command -v dnf &>/dev/null; then PKG=dnf
     elif command -v pacman &>/dev/null; then PKG=pacman
@@ -21,54 +23,94 @@ detect_pkg() {
     ok "Detected package manager: $PKG"
 }
 
-# Install dependencies
-install_deps() {
-    msg "Installing dependencies..."
-    case $PKG in
-        apt)
-            sudo apt update -y
-            sudo apt install -y git curl wget build-essential python3 python3-pip
-            ;;
-        dnf)
-            sudo dnf install -y git curl wget gcc gcc-c++ make python3 python3-pip
-            ;;
-        pacman)
-            sudo pacman -Sy --noconfirm git curl wget base-devel python python-pip
-            ;;
-    esac
-    ok "Dependencies installed"
+# True if the apt package lists were refreshed within the last hour.
+# Judged by the index files themselves: an emptied lists dir (the usual
+# container cleanup) has no Packages files and counts as stale.
+apt_cache_fresh() {
+    local lists=/var/lib/apt/lists stamp=/var/lib/apt/periodic/update-success-stamp
+    local ttl=3600 newest t
+    compgen -G "$lists/*_Packages*" >/dev/null || return 1
+    newest=$(find "$lists" -maxdepth 1 -type f \( -name '*_InRelease' -o -name '*_Release' -o -name '*_Packages*' \) \
+        -printf '%T@\n' 2>/dev/null | sort -n | tail -n 1)
+    newest=${newest%.*}
+    # apt may date index files from the server; the update hook's stamp is the fetch time
+    if [[ -f $stamp ]]; then
+        t=$(stat -c %Y "$stamp")
+        (( t > ${newest:-0} )) && newest=$t
+    fi
+    [[ -n $newest ]] && (( $(date +%s) - newest < ttl ))
 }
 
-# GPU driver setup
-setup_gpu() {
-    GPU=$(lspci | grep -E "VGA|3D" | grep -i "nvidia\|amd\|intel" || true)
-    [[ -z "$GPU" ]] && { warn "No GPU detected"; return; }
-    msg "Detected GPU: $GPU"
+# Print one vendor per GPU from the PCI IDs in sysfs, falling back to lspci.
+# The PCI bus lists every display controller whether or not a driver is
+# bound, unlike /sys/class/drm, so an undriven dGPU is still found.
+gpu_vendors() {
+    local dev class id found=
+    for dev in /sys/bus/pci/devices/*; do
+        read -r class 2>/dev/null < "$dev/class" || continue
+        case $class in 0x0300*|0x0302*) ;; *) continue ;; esac    # VGA / 3D
+        read -r id 2>/dev/null < "$dev/vendor" || continue
+        case $id in
+            0x10de) echo nvidia; found=1 ;;
+            0x1002) echo amd; found=1 ;;
+            0x8086) echo intel; found=1 ;;
+        esac
+    done
+    [[ -n $found ]] && return
+    command -v lspci &>/dev/null || return 0
+    lspci | grep -E "VGA|3D" | grep -io "nvidia\|amd\|intel" | tr '[:upper:]' '[:lower:]' || true
+}
 
+# Pick the driver packages for every detected GPU into GPU_PKGS
+select_gpu_pkgs() {
+    # One entry per vendor, however many cards of that vendor are present
+    local vendors vendor
+    vendors=$(gpu_vendors | sort -u)
+    [[ -z $vendors ]] && { warn "No GPU detected"; return; }
+    msg "Detected GPU: ${vendors//$'\n'/, }"
+
+    local pkgs=()
+    for vendor in $vendors; do
+        case $PKG/$vendor in
+            apt/nvidia)    pkgs+=(nvidia-driver-535) ;;
+            apt/amd)       pkgs+=(mesa-vulkan-drivers mesa-utils) ;;
+            apt/intel)     pkgs+=(intel-media-va-driver mesa-vulkan-drivers) ;;
+            dnf/nvidia)    pkgs+=(akmod-nvidia xorg-x11-drv-nvidia-cuda) ;;
+            dnf/amd)       pkgs+=(mesa-dri-drivers mesa-vulkan-drivers) ;;
+            dnf/intel)     pkgs+=(intel-media-driver mesa-vulkan-drivers) ;;
+            pacman/nvidia) pkgs+=(nvidia nvidia-utils) ;;
+            pacman/amd)    pkgs+=(mesa vulkan-radeon) ;;
+            pacman/intel)  pkgs+=(mesa vulkan-intel) ;;
+        esac
+    done
+    mapfile -t GPU_PKGS < <(printf '%s\n' "${pkgs[@]}" | sort -u)
+}
+
+# Install dependencies and GPU drivers in a single transaction:
+# one package-manager lock and one dependency solve for everything
+install_deps() {
+    msg "Installing dependencies..."
     case $PKG in
         apt)
-            if echo "$GPU" | grep -qi nvidia; then sudo apt install -y nvidia-driver-535
-            elif echo "$GPU" | grep -qi amd; then sudo apt install -y mesa-vulkan-drivers mesa-utils
-            elif echo "$GPU" | grep -qi intel; then sudo apt install -y intel-media-va-driver mesa-vulkan-drivers; fi
+            if apt_cache_fresh; then msg "Package lists are fresh, skipping apt update"
+            else sudo apt update -y; fi
+            sudo apt install -y git curl wget build-essential python3 python3-pip "${GPU_PKGS[@]}"
             ;;
         dnf)
-            if echo "$GPU" | grep -qi nvidia; then sudo dnf install -y akmod-nvidia xorg-x11-drv-nvidia-cuda
-            elif echo "$GPU" | grep -qi amd; then sudo dnf install -y mesa-dri-drivers mesa-vulkan-drivers
-            elif echo "$GPU" | grep -qi intel; then sudo dnf install -y intel-media-driver mesa-vulkan-drivers; fi
+            sudo dnf install -y git curl wget gcc gcc-c++ make python3 python3-pip "${GPU_PKGS[@]}"
             ;;
         pacman)
-            if echo "$GPU" | grep -qi nvidia; then sudo pacman -S --noconfirm nvidia nvidia-utils
-            elif echo "$GPU" | grep -qi amd; then sudo pacman -S --noconfirm mesa vulkan-radeon
-            elif echo "$GPU" | grep -qi intel; then sudo pacman -S --noconfirm mesa vulkan-intel; fi
+            sudo pacman -Sy --needed --noconfirm git curl wget base-devel python python-pip "${GPU_PKGS[@]}"
             ;;
     esac
-    ok "GPU drivers installed"
+    ok "Dependencies installed"
+    if (( ${#GPU_PKGS[@]} )); then ok "GPU drivers installed"; fi
 }
 
 # Clone and install
 install_winpatable() {
     msg "Cloning Winpatable..."
-    git clone https://github.com/thomasboy2017/Winpatable-.git /tmp/Winpatable- || true
+    git clone --depth 1 https://github.com/thomasboy2017/Winpatable-.git /tmp/Winpatable- || true
     cd /tmp/Winpatable-
     python3 -m venv venv && source venv/bin/activate
     pip install -q --upgrade pip setuptools wheel
@@ -84,8 +126,17 @@ install_winpatable() {
 # Post-install test
 gpu_test() {
     msg "Testing GPU setup..."
-    if command -v glxinfo &>/dev/null; then glxinfo | grep "OpenGL renderer"
-    elif command -v vulkaninfo &>/dev/null; then vulkaninfo | grep "GPU id"
+    # Probes can hang without a display or with a broken ICD, so bound them.
+    # Brief modes skip the extension/format dumps that would only be grepped away.
+    if command -v glxinfo &>/dev/null; then
+        timeout 10 glxinfo -B | grep "OpenGL renderer" || warn "OpenGL probe failed or timed out"
+    elif command -v vulkaninfo &>/dev/null; then
+        # Older vulkan-tools reject --summary; fall back to the full dump,
+        # which also carries deviceName (but not after a timeout)
+        local out rc=0
+        out=$(timeout 10 vulkaninfo --summary 2>/dev/null) || rc=$?
+        if (( rc != 0 && rc != 124 )); then out=$(timeout 10 vulkaninfo 2>/dev/null) || true; fi
+        grep "deviceName" <<< "$out" || warn "Vulkan probe failed or timed out"
     else warn "No GPU test tool found"; fi
 }
 
@@ -93,8 +144,8 @@ gpu_test() {
 clear
 echo -e "${BLUE}=== Winpatable Universal Installer ===${NC}"
 detect_pkg
+select_gpu_pkgs
 install_deps
-setup_gpu
 install_winpatable
 gpu_test
 echo -e "${GREEN}✓ Installation complete! Run 'winpatable --help' to get started.${NC}"